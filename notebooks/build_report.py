@@ -0,0 +1,163 @@
+"""Rebuild the figures and tables in jb/ whose inputs have changed.
+
+Each artifact below names the files it is made from. `build_report` hashes
+those files along with the code of the build function and rebuilds only
+the artifacts whose hash has changed since the last run, in parallel.
+
+This script is the only writer of these files; the notebooks display the
+same plots but don't save them. Run from the notebooks directory after
+`process_cps.ipynb` and the model notebooks have written the preprocessed
+data and the traces:
+
+    python build_report.py
+    python build_report.py --force
+"""
+
+import argparse
+
+import arviz as az
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+from utils import Artifact, build_report, decorate
+
+PREPROCESSED = "../data/fertility_cps_preprocessed.h5"
+H2 = "../data/h2.csv"
+
+
+def forest_plot(summary, labels, **options):
+    """Plot means and HDIs from an ArviZ summary."""
+    means = summary["mean"].to_numpy()
+    hdi_lower = summary["hdi_3%"].to_numpy()
+    hdi_upper = summary["hdi_97%"].to_numpy()
+
+    x_positions = np.arange(len(means))
+    plt.xticks(x_positions, labels, **options)
+    plt.errorbar(
+        x_positions,
+        means,
+        yerr=[means - hdi_lower, hdi_upper - means],
+        fmt="o",
+        markersize=4,
+        capsize=2,
+        color="C0",
+    )
+
+
+def plot_cfr_comparison(target, preprocessed, h2):
+    """Compare CFR computed from CPS with the Census series."""
+    cfr_cps = pd.read_hdf(preprocessed, key="cfr_cps")
+    cfr_h2 = pd.read_csv(h2, index_col="Year", thousands=",")["Rate"] / 1000
+
+    plt.figure(figsize=(10, 6))
+    cfr_cps.plot(label="CPS CFR (ages 40-44)", alpha=0.8)
+    cfr_h2.plot(alpha=0.8, label="Census CFR (ages 40-44)")
+    decorate(
+        title="Completed cohort fertility rate (CFR) comparison",
+        ylabel="Completed cohort fertility rate (CFR)",
+        ylim=[0, 3.5],
+    )
+    plt.savefig(target, dpi=150, bbox_inches="tight")
+
+
+def plot_parity_heatmap(target, preprocessed):
+    """Plot total parity by birth cohort and age group."""
+    sum_df = pd.read_hdf(preprocessed, key="sum_df")
+
+    plt.figure(figsize=(12, 6))
+    sns.heatmap(
+        sum_df, cmap="YlGnBu", annot=True, fmt=".0f", cbar_kws={"label": "Total parity"}
+    )
+    plt.title("Total Parity by Birth Cohort and Age Group")
+    plt.xlabel("Age Group")
+    plt.ylabel("Birth Cohort")
+    plt.grid(False)
+    plt.savefig(target, dpi=150, bbox_inches="tight")
+
+
+def plot_effects(target, idata_file, preprocessed, var_name="alpha"):
+    """Plot cohort (alpha, gamma) or age (beta) effects from a trace."""
+    idata = az.from_netcdf(idata_file)
+    summary = az.summary(idata, var_names=[var_name], kind="stats")
+    if var_name == "beta":
+        labels = pd.read_hdf(preprocessed, key="age_labels").values
+        xlabel, title, options = "Ages", "Age Effects", {}
+    else:
+        labels = pd.read_hdf(preprocessed, key="cohort_labels").values
+        xlabel, title, options = "Cohorts", "Cohort Effects", {"rotation": 45}
+
+    plt.figure()
+    forest_plot(summary, labels, **options)
+    plt.ylabel("Effect Size")
+    plt.xlabel(xlabel)
+    plt.title(title)
+    plt.tight_layout()
+    plt.savefig(target, dpi=150, bbox_inches="tight")
+
+
+def write_cfr_table(target, idata_file, preprocessed, cfr_age=42):
+    """Write predicted CFR by cohort as an HTML table."""
+    idata = az.from_netcdf(idata_file)
+    cohort_labels = pd.read_hdf(preprocessed, key="cohort_labels").values
+    age_labels = pd.read_hdf(preprocessed, key="age_labels").values
+    age_index = list(age_labels).index(cfr_age)
+
+    lambda_ = idata.posterior["lambda"].to_numpy()
+    cfr = np.cumsum(lambda_, axis=-1)[..., age_index]
+    hdi = az.hdi(cfr)
+    table = pd.DataFrame(
+        {"CFR": cfr.mean(axis=(0, 1)), "HDI lower": hdi[:, 0], "HDI upper": hdi[:, 1]},
+        index=pd.Index(cohort_labels, name="Cohort"),
+    )
+    with open(target, "w", encoding="utf8") as fp:
+        fp.write(table.round(2).to_html())
+
+
+def make_artifacts(cutoff_year, version):
+    """List the artifacts in the report for one cutoff year and model version."""
+    trace = f"nc/fertility_cps_idata_{cutoff_year}_{version}.nc"
+    return [
+        Artifact("../jb/figs/cfr_comparison.png", plot_cfr_comparison, [PREPROCESSED, H2]),
+        Artifact("../jb/figs/parity_heatmap.png", plot_parity_heatmap, [PREPROCESSED]),
+        Artifact(
+            f"../jb/figs/cohort_effects_{version}.png",
+            plot_effects,
+            [trace, PREPROCESSED],
+            dict(var_name="alpha"),
+        ),
+        Artifact(
+            f"../jb/figs/age_effects_{version}.png",
+            plot_effects,
+            [trace, PREPROCESSED],
+            dict(var_name="beta"),
+        ),
+        Artifact(
+            f"../jb/tables/cfr_{version}.html",
+            write_cfr_table,
+            [trace, PREPROCESSED],
+        ),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cutoff", type=int, default=2024)
+    parser.add_argument("--version", default="v4")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--force", action="store_true", help="rebuild everything")
+    args = parser.parse_args()
+
+    artifacts = make_artifacts(args.cutoff, args.version)
+    results = build_report(
+        artifacts,
+        manifest="../jb/build_manifest.json",
+        max_workers=args.workers,
+        force=args.force,
+    )
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
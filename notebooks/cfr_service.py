@@ -0,0 +1,117 @@
+"""Local query service for projected CFR from cached posteriors.
+
+Examples:
+
+    python cfr_service.py query --cohort 1995 --age 42 --cutoff 2018 --version v4
+    python cfr_service.py serve --port 8000
+
+With the server running, the same question is
+
+    http://localhost:8000/cfr?cohort=1995&age=42&cutoff=2018&version=v4
+
+and http://localhost:8000/keys lists the available cutoffs and versions.
+"""
+
+import argparse
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from utils import CFRQueryService
+
+
+def load_labels(filename):
+    """Read cohort and age labels from the preprocessed data file, if it exists.
+
+    Args:
+        filename: path of the preprocessed HDF5 store
+
+    Returns:
+        tuple of (cohort_labels, age_labels), or (None, None)
+    """
+    if not os.path.exists(filename):
+        return None, None
+    cohort_labels = pd.read_hdf(filename, key="cohort_labels").values
+    age_labels = pd.read_hdf(filename, key="age_labels").values
+    return cohort_labels, age_labels
+
+
+def make_handler(service):
+    """Make a request handler class that answers queries from service."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                if url.path == "/keys":
+                    body = [list(key) for key in service.keys()]
+                elif url.path == "/cfr":
+                    body = service.query(
+                        cohort=int(params["cohort"]),
+                        age=int(params.get("age", 42)),
+                        cutoff=int(params["cutoff"]),
+                        version=params.get("version", "v4"),
+                        prob=float(params.get("prob", 0.9)),
+                    )
+                else:
+                    self.send_error(404)
+                    return
+            except (KeyError, ValueError) as e:
+                self.send_error(400, str(e))
+                return
+            except Exception as e:
+                self.send_error(500, str(e))
+                return
+
+            data = json.dumps(body).encode("utf8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--directory", default="nc", help="directory of trace files")
+    parser.add_argument(
+        "--labels",
+        default="../data/fertility_cps_preprocessed.h5",
+        help="preprocessed data file with the cohort and age labels of the "
+        "latest cutoff; earlier cutoffs use its first cohorts",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query = subparsers.add_parser("query", help="answer one query and exit")
+    query.add_argument("--cohort", type=int, required=True)
+    query.add_argument("--age", type=int, default=42)
+    query.add_argument("--cutoff", type=int, required=True)
+    query.add_argument("--version", default="v4")
+    query.add_argument("--prob", type=float, default=0.9)
+
+    serve = subparsers.add_parser("serve", help="answer queries over HTTP")
+    serve.add_argument("--host", default="localhost")
+    serve.add_argument("--port", type=int, default=8000)
+
+    args = parser.parse_args()
+    cohort_labels, age_labels = load_labels(args.labels)
+    service = CFRQueryService(args.directory, cohort_labels, age_labels)
+    service.refresh(force=True)
+
+    if args.command == "query":
+        result = service.query(args.cohort, args.age, args.cutoff, args.version, args.prob)
+        print(json.dumps(result, indent=2))
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+        print(f"Serving {len(service.keys())} traces on http://{args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()